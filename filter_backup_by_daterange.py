@@ -19,15 +19,50 @@ Usage:
     --backup-dir "c:\path\to\backup"
 """
 
+import errno
 import json
 import gzip
+import functools
+import io
 import logging
+import mmap
+import os
+import re
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import List, Set, Dict, Optional, Tuple
+from typing import Callable, Iterable, Iterator, List, Set, Dict, Optional, Tuple, Union
 import argparse
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import tarfile
+import time
+from collections import defaultdict
+from itertools import islice, repeat
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the standard library is used otherwise
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional; arrays are decoded in one piece otherwise
+    ijson = None
+
+# Errors raised while decoding JSON, whichever parser is in use
+JSON_DECODE_ERRORS: Tuple[type, ...] = (json.JSONDecodeError,)
+if ijson is not None:
+    JSON_DECODE_ERRORS += (ijson.JSONError,)
+
+try:
+    import ciso8601
+except ImportError:  # optional speedup; the standard library is used otherwise
+    ciso8601 = None
+
+try:
+    from isal import igzip as gzip_mod
+except ImportError:  # optional speedup; the standard library is used otherwise
+    gzip_mod = gzip
 
 # Configure logging
 logging.basicConfig(
@@ -36,21 +71,417 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-file work is dominated by small-file I/O, so oversubscribe the CPUs
+MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Larger reads amortize per-call overhead when inflating week files
+READ_BUFFER_SIZE = 128 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# ULIDs (Crockford base32) encode their creation time in the first 10 characters; the
+# 48-bit timestamp means a valid ULID never starts above '7'
+ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ULID_PATTERN = re.compile(r'[0-7][0-9A-HJKMNP-TV-Z]{25}', re.IGNORECASE)
+
+# A ULID records when an item was created, not the dates it covers. Items can be created
+# or imported long after their dates, so only items created well before the range are
+# skipped by name
+FILENAME_SHORTCUT_MARGIN = timedelta(days=31)
+
+# Files may be bucketed by local time, so their contents can spill up to a day past
+# the nominal period; only treat a file as fully inside the range with this slack
+PERIOD_BOUNDARY_MARGIN = timedelta(days=1)
+
+# Filtered output is scratch data, so favour speed: level 1 compresses several times
+# faster than the default 9 for only slightly larger files
+DEFAULT_COMPRESSLEVEL = 1
+# isal only implements levels 0-3
+MAX_COMPRESSLEVEL = 9 if gzip_mod is gzip else 3
+
+
+def _write_json_array(path: Path, items: Iterable) -> int:
+    """
+    Write items to path as a JSON array, encoding one element at a time.
+    
+    The file is only created once the first item arrives. It is written under a
+    temporary name and renamed into place on success, so an error raised while
+    iterating items leaves no truncated array behind.
+    
+    Returns:
+        Count of items written
+    """
+    count = 0
+    output = None
+    partial_path = path.with_name(path.name + '.partial')
+    try:
+        for item in items:
+            if output is None:
+                output = open(partial_path, 'wb', buffering=WRITE_BUFFER_SIZE)
+                output.write(b'[')
+            else:
+                output.write(b',')
+            output.write(_json_dumps(item))
+            count += 1
+        if output is not None:
+            output.write(b']')
+            output.close()
+            os.replace(partial_path, path)
+    except BaseException:
+        if output is not None:
+            output.close()
+            if partial_path.exists():
+                partial_path.unlink()
+        raise
+    return count
+
+
+def _list_file_names(directory: Path, suffix: str) -> Set[str]:
+    """List the names of files in a directory ending with suffix, in a single scandir pass."""
+    with os.scandir(directory) as entries:
+        return {entry.name for entry in entries if entry.name.endswith(suffix)}
+
+
+def _json_loads(data: Union[bytes, memoryview]):
+    """Decode JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """Encode JSON to UTF-8 bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def _fast_copy(src: Path, dst: Path) -> None:
+    """
+    Copy a file's contents, without its metadata.
+    
+    Uses a single in-kernel os.copy_file_range call where available (Linux), which
+    also lets Btrfs/XFS share extents; otherwise falls back to shutil.copyfile.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        shutil.copyfile(src, dst)
+        return
+    
+    unsupported = False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if not copied:
+                    break
+                remaining -= copied
+        
+        if remaining > 0:
+            # Some filesystems report an unsupported copy by copying nothing (as shutil also
+            # assumes); stopping short after copying part of the file is a real failure
+            if remaining == size:
+                unsupported = True
+            else:
+                os.unlink(dst)
+                raise OSError(errno.EIO, f"copy_file_range stopped {remaining} bytes short", str(src))
+    except OSError as e:
+        # Cross-device copies on older kernels and some filesystems refuse the call
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        unsupported = True
+    
+    if unsupported:
+        shutil.copyfile(src, dst)
+
+
+def _open_gzip(path: Path) -> io.BufferedReader:
+    """Open a gzip file for binary reading through a large read buffer."""
+    return io.BufferedReader(gzip_mod.open(path, 'rb'), buffer_size=READ_BUFFER_SIZE)
+
+
+def _write_gzip(path: Path, data: bytes, compresslevel: int = DEFAULT_COMPRESSLEVEL) -> None:
+    """Compress data into a gzip file, flushing to disk in large writes."""
+    compresslevel = min(compresslevel, MAX_COMPRESSLEVEL)
+    with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as raw:
+        with gzip_mod.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel) as f:
+            f.write(data)
+
+
+def _iter_gzip_json_array(path: Path) -> Iterator:
+    """Yield the elements of a gzip-compressed JSON array; empty files yield nothing.
+
+    Streams with ijson when it is installed so only matching elements need to
+    be kept in memory; otherwise the file is inflated in one call and decoded
+    in one piece.
+    """
+    if ijson is not None:
+        with _open_gzip(path) as f:
+            if f.peek(1):
+                yield from ijson.items(f, 'item', use_float=True)
+    else:
+        data = gzip_mod.decompress(path.read_bytes())
+        if data:
+            yield from _json_loads(data)
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_date(date_str: Optional[str]) -> Optional[datetime]:
+    """Parse ISO datetime string to naive datetime (UTC assumed).
+
+    Cached because sample timestamps repeat heavily within a backup.
+    """
+    if not date_str:
+        return None
+    
+    try:
+        # Fast path: canonical 'YYYY-MM-DDTHH:MM:SS', bare or with the 'Z' suffix Arc writes
+        if date_str[10:11] in ('T', ' ') and (
+            len(date_str) == 19 or (len(date_str) == 20 and date_str[19] == 'Z')
+        ):
+            return datetime.fromisoformat(date_str[:19])
+        
+        if ciso8601 is not None:
+            # Parses offsets and fractional seconds natively, discarding the offset like below
+            return ciso8601.parse_datetime_as_naive(date_str)
+        
+        # Handle both space and T separator
+        normalized = date_str.replace(' ', 'T')
+        # Remove timezone info
+        if 'Z' in normalized:
+            normalized = normalized.replace('Z', '')
+        elif '+' in normalized:
+            normalized = normalized.split('+')[0]
+        elif normalized.count('-') > 2:  # has negative timezone
+            parts = normalized.split('-')
+            normalized = '-'.join(parts[:3])  # keep only date parts
+        return datetime.fromisoformat(normalized)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _date_key(date_str: Optional[str]) -> Optional[str]:
+    """Return a sortable 'YYYY-MM-DDTHH:MM:SS' key for an ISO datetime string.
+
+    Canonical strings are sliced directly (ISO-8601 compares lexicographically);
+    anything else falls back to _parse_date. Sub-second precision is dropped.
+    """
+    if not isinstance(date_str, str):
+        return None
+    if len(date_str) >= 19:
+        if date_str[10] == 'T':
+            return date_str[:19]
+        if date_str[10] == ' ':
+            return f"{date_str[:10]}T{date_str[11:19]}"
+    parsed = _parse_date(date_str)
+    return parsed.isoformat(timespec='seconds') if parsed else None
+
+
+def _ulid_timestamp(ulid: str) -> int:
+    """Decode the creation time (Unix milliseconds) from the first 10 characters of a ULID."""
+    millis = 0
+    for char in ulid[:10].upper():
+        millis = millis * 32 + ULID_ALPHABET.index(char)
+    return millis
+
+
+def _period_fully_inside(
+    period_start: datetime, period_end: datetime, start_dt: datetime, end_dt: datetime
+) -> bool:
+    """Check whether [period_start, period_end) lies inside the range, allowing for boundary spill."""
+    return start_dt <= period_start - PERIOD_BOUNDARY_MARGIN and period_end + PERIOD_BOUNDARY_MARGIN <= end_dt
+
+
+def _make_overlap_predicate(
+    start_dt: datetime, end_dt: datetime
+) -> Callable[[Optional[str], Optional[str]], bool]:
+    """
+    Build a predicate testing whether an item's date keys overlap the range.
+    
+    The bounds are bound once as ISO string keys, so each call is two string
+    comparisons with no datetime objects involved.
+    """
+    start_key = start_dt.isoformat(timespec='seconds')
+    end_key = end_dt.isoformat(timespec='seconds')
+    
+    def overlaps(item_start: Optional[str], item_end: Optional[str]) -> bool:
+        if not item_start or not item_end:
+            return False
+        return item_start <= end_key and item_end >= start_key
+    
+    return overlaps
+
+
+def _peek_date_key(data: bytes, field: bytes) -> Optional[str]:
+    """
+    Find the date key of a JSON string field by scanning raw bytes, without decoding.
+    
+    Only answers when the quoted field name occurs exactly once and holds a
+    canonical ISO datetime; otherwise returns None so the caller falls back to a
+    full parse. Keys found this way match what _date_key returns after a full
+    parse, so rejecting on them gives the same result.
+    """
+    idx = data.find(field)
+    if idx < 0 or data.find(field, idx + 1) >= 0:
+        return None
+    return _read_date_value(data, idx + len(field))
+
+
+def _read_date_value(data: bytes, pos: int) -> Optional[str]:
+    """Read the canonical ISO datetime string value following a field name ending at pos."""
+    value_start = data.find(b'"', pos)
+    if value_start < 0 or data[pos:value_start].strip() != b':':
+        return None
+    
+    value = data[value_start + 1:value_start + 20]
+    if len(value) != 19 or value[4:5] != b'-' or value[10:11] != b'T' or b'"' in value or b'\\' in value:
+        return None
+    try:
+        return value.decode('ascii')
+    except UnicodeDecodeError:
+        return None
+
+
+def _filter_samples(samples: Iterable[Dict], start_key: str, end_key: str) -> List[Dict]:
+    """Return the samples whose date key falls within [start_key, end_key]."""
+    filtered = []
+    append = filtered.append
+    for sample in samples:
+        date_str = sample.get('date')
+        # Inline the canonical case of _date_key; this loop runs once per sample
+        if type(date_str) is str and len(date_str) >= 19 and date_str[10] == 'T':
+            key = date_str[:19]
+        else:
+            key = _date_key(date_str)
+        if key and start_key <= key <= end_key:
+            append(sample)
+    return filtered
+
+
+def _copy_week_file(week_file: Path, output_dir: Path, start_key: str, end_key: str) -> Optional[int]:
+    """
+    Copy a week file whole, counting its samples by their "date" keys.
+    
+    Only copies when the first and last samples' dates lie within [start_key,
+    end_key]; returns None otherwise, so the caller filters the week per sample.
+    """
+    # Decompressing validates the gzip stream before anything is copied. Each chunk is scanned
+    # with the previous chunk's last 64 bytes prepended, so a key or date value split across the
+    # boundary is still found, and memory stays bounded
+    sample_count = 0
+    tail = b''
+    first = last = b''
+    first_region = last_region = None
+    with _open_gzip(week_file) as f:
+        while True:
+            chunk = f.read(READ_BUFFER_SIZE)
+            if not chunk:
+                break
+            window = tail + chunk
+            # A key lying wholly inside the overlap was counted with the previous chunk
+            sample_count += window.count(b'"date"', max(0, len(tail) - 5))
+            if first_region is None or len(first_region) < 64:
+                idx = window.find(b'"date"')
+                if idx >= 0:
+                    first_region = window[idx:idx + 64]
+            idx = window.rfind(b'"date"')
+            if idx >= 0:
+                last_region = window[idx:idx + 64]
+            tail = window[-64:]
+            stripped = chunk.strip()
+            if stripped:
+                first = first or stripped[:1]
+                last = stripped[-1:]
+    
+    if not first:
+        return 0
+    # Without decoding, a truncated or mangled array is at least caught by its brackets
+    if first != b'[' or last != b']':
+        logger.warning(f"Invalid JSON in week file: {week_file.name}")
+        return 0
+    
+    if sample_count:
+        first_key = _read_date_value(first_region, 6)
+        last_key = _read_date_value(last_region, 6)
+        if not (first_key and last_key and start_key <= first_key and last_key <= end_key):
+            return None
+        
+        _fast_copy(week_file, output_dir / week_file.name)
+        logger.debug(f"Week {week_file.name}: {sample_count} samples (copied)")
+    return sample_count
+
+
+def _process_week_file(
+    week_file: Path, fully_inside: bool, start_key: str, end_key: str, output_dir: Path, compresslevel: int
+) -> int:
+    """
+    Filter one LocomotionSample week file into output_dir.
+    
+    Module-level so it can run in a worker process. Weeks lying fully inside the
+    range are copied as-is, without decoding or recompressing any sample, when
+    their first and last samples confirm it.
+    
+    Returns:
+        Count of samples written
+    """
+    try:
+        if fully_inside:
+            copied = _copy_week_file(week_file, output_dir, start_key, end_key)
+            if copied is not None:
+                return copied
+        
+        # Read week file and filter samples by date
+        filtered_samples = _filter_samples(_iter_gzip_json_array(week_file), start_key, end_key)
+        
+        if filtered_samples:
+            # Write filtered samples to output
+            output_file = output_dir / week_file.name
+            _write_gzip(output_file, _json_dumps(filtered_samples), compresslevel)
+            
+            logger.debug(f"Week {week_file.name}: {len(filtered_samples)} samples")
+            return len(filtered_samples)
+    
+    except (gzip.BadGzipFile, EOFError):
+        logger.warning(f"Corrupted gzip file: {week_file.name}")
+    except JSON_DECODE_ERRORS:
+        logger.warning(f"Invalid JSON in week file: {week_file.name}")
+    except Exception as e:
+        logger.warning(f"Error processing {week_file.name}: {e}")
+    
+    return 0
+
 
 class BackupFilter:
     """Filters and copies LocoKit1/LocoKit2 backup data by date range."""
     
-    def __init__(self, backup_dir: str, output_dir: str):
+    def __init__(
+        self,
+        backup_dir: str,
+        output_dir: str,
+        filename_shortcut: bool = False,
+        output_compresslevel: int = DEFAULT_COMPRESSLEVEL,
+        consolidate: bool = False,
+    ):
         """
         Initialize the filter.
         
         Args:
             backup_dir: Path to source Arc/LocoKit1 or LocoKit2 backup
             output_dir: Path to output directory (will be created)
+            filename_shortcut: Skip LocoKit1 TimelineItems whose ULID filename shows they
+                were created well before the range, without opening them
+            output_compresslevel: gzip level (0-9) for filtered sample files
+            consolidate: Write LocoKit1 TimelineItems into one TimelineItem.tar
+                instead of one file each (ignored for LocoKit2 backups)
         """
         self.backup_dir = Path(backup_dir)
         self.output_dir = Path(output_dir)
+        self.filename_shortcut = filename_shortcut
+        self.output_compresslevel = output_compresslevel
         self.backup_type = self._detect_backup_type()
+        # LocoKit2 items are already consolidated into month files
+        self.consolidate = consolidate and self.backup_type == "locokit1"
         
         if self.backup_type == "locokit1":
             self.timeline_item_dir = self.backup_dir / "TimelineItem"
@@ -82,7 +513,8 @@ class BackupFilter:
             self.output_place_dir = self.output_dir / "places"
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.output_timeline_dir.mkdir(parents=True, exist_ok=True)
+        if not self.consolidate:
+            self.output_timeline_dir.mkdir(parents=True, exist_ok=True)
         self.output_sample_dir.mkdir(parents=True, exist_ok=True)
         self.output_place_dir.mkdir(parents=True, exist_ok=True)
 
@@ -104,28 +536,7 @@ class BackupFilter:
             "or LocoKit2 (items/samples) directories."
         )
     
-    @staticmethod
-    def _parse_date(date_str: Optional[str]) -> Optional[datetime]:
-        """Parse ISO datetime string to naive datetime (UTC assumed)."""
-        if not date_str:
-            return None
-        
-        try:
-            # Handle both space and T separator
-            normalized = date_str.replace(' ', 'T')
-            # Remove timezone info
-            if 'Z' in normalized:
-                normalized = normalized.replace('Z', '')
-            elif '+' in normalized:
-                normalized = normalized.split('+')[0]
-            elif normalized.count('-') > 2:  # has negative timezone
-                parts = normalized.split('-')
-                normalized = '-'.join(parts[:3])  # keep only date parts
-            return datetime.fromisoformat(normalized)
-        except (ValueError, AttributeError):
-            return None
-    
-    def filter_timeline_items(self, start_date: str, end_date: str) -> Tuple[Set[str], int]:
+    def filter_timeline_items(self, start_dt: datetime, end_dt: datetime) -> Tuple[Set[str], int]:
         """
         Filter and copy TimelineItems within date range.
         
@@ -133,92 +544,102 @@ class BackupFilter:
             Tuple of (place IDs referenced by filtered items, filtered item count)
         
         Args:
-            start_date: ISO datetime string (YYYY-MM-DD HH:MM:SS)
-            end_date: ISO datetime string (YYYY-MM-DD HH:MM:SS)
+            start_dt: Start of the range (naive, inclusive)
+            end_dt: End of the range (naive, inclusive)
         """
-        start_dt = self._parse_date(start_date)
-        end_dt = self._parse_date(end_date)
-        
-        if not start_dt or not end_dt:
-            raise ValueError("Invalid date format. Use: YYYY-MM-DD HH:MM:SS")
-        
-        if start_dt > end_dt:
-            raise ValueError("Start date cannot be after end date")
-        
-        logger.info(f"Filtering TimelineItems from {start_date} to {end_date}")
+        logger.info(f"Filtering TimelineItems from {start_dt} to {end_dt}")
         
         place_ids: Set[str] = set()
         item_count = 0
+        overlaps = _make_overlap_predicate(start_dt, end_dt)
 
         if self.backup_type == "locokit1":
-            bucket_count = 0
-            bucket_dirs = sorted([d for d in self.timeline_item_dir.iterdir() if d.is_dir()])
+            with os.scandir(self.timeline_item_dir) as entries:
+                # Processing order doesn't matter; only the summary log is sorted
+                bucket_dirs = [Path(e.path) for e in entries if e.is_dir()]
+            bucket_items: Dict[str, int] = {}
 
-            for bucket_dir in bucket_dirs:
-                bucket_name = bucket_dir.name
-                bucket_items = 0
-
-                output_bucket = self.output_timeline_dir / bucket_name
-                output_bucket.mkdir(exist_ok=True)
-
-                for item_file in bucket_dir.glob("*.json"):
-                    try:
-                        if item_file.stat().st_size == 0:
-                            continue
+            skip_before = None
+            if self.filename_shortcut and self._uses_ulid_filenames(bucket_dirs):
+                # Bound as Unix milliseconds so each name is checked without building a datetime
+                since_epoch = start_dt - datetime(1970, 1, 1) - FILENAME_SHORTCUT_MARGIN
+                skip_before = since_epoch // timedelta(milliseconds=1)
+                logger.info("ULID file names detected; skipping items created well before the range")
+            skipped_by_name = 0
 
-                        with open(item_file, 'r', encoding='utf-8') as f:
-                            item = json.load(f)
-
-                        item_start = self._parse_date(item.get('startDate'))
-                        item_end = self._parse_date(item.get('endDate'))
+            archive = None
+            try:
+                if self.consolidate:
+                    # Matches are streamed into one uncompressed tar by this thread; workers only read
+                    archive_path = self.output_dir / f"{self.output_timeline_dir.name}.tar"
+                    archive = tarfile.open(archive_path, 'w', format=tarfile.PAX_FORMAT)
+                    archive_mtime = time.time()
+                else:
+                    # Create every output bucket up front so workers never touch directories
+                    for bucket_dir in bucket_dirs:
+                        (self.output_timeline_dir / bucket_dir.name).mkdir(exist_ok=True)
 
-                        if item_start and item_end and item_start <= end_dt and item_end >= start_dt:
-                            output_file = output_bucket / item_file.name
-                            shutil.copy2(item_file, output_file)
+                with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                    futures = {}
+                    for entry, bucket_name in self._iter_timeline_item_entries(bucket_dirs):
+                        if skip_before is not None and ULID_PATTERN.fullmatch(entry.name[:-5]):
+                            if _ulid_timestamp(entry.name) < skip_before:
+                                skipped_by_name += 1
+                                continue
+                        future = executor.submit(self._filter_timeline_item_file, entry, bucket_name, overlaps)
+                        futures[future] = entry.name, bucket_name
 
-                            if item.get('isVisit') and 'placeId' in item:
-                                place_ids.add(item['placeId'])
+                    for future in as_completed(futures):
+                        # Drop each future once handled so its result (possibly item bytes) can be freed
+                        name, bucket_name = futures.pop(future)
+                        result, place_id = future.result()
+                        if not result:
+                            continue
 
-                            bucket_items += 1
-                            item_count += 1
+                        if archive is not None:
+                            # Members keep the TimelineItem/<bucket>/<file> layout of the unpacked output
+                            info = tarfile.TarInfo(f"{self.output_timeline_dir.name}/{bucket_name}/{name}")
+                            info.size = len(result)
+                            info.mtime = archive_mtime
+                            archive.addfile(info, io.BytesIO(result))
+                        bucket_items[bucket_name] = bucket_items.get(bucket_name, 0) + 1
+                        item_count += 1
+                        if place_id:
+                            place_ids.add(place_id)
+            finally:
+                if archive is not None:
+                    archive.close()
 
-                    except json.JSONDecodeError:
-                        logger.warning(f"Skipping corrupted JSON: {item_file.name}")
-                    except Exception as e:
-                        logger.warning(f"Error processing {item_file.name}: {e}")
+            for bucket_name, count in sorted(bucket_items.items()):
+                logger.debug(f"Bucket {bucket_name}: {count} items")
+            bucket_count = len(bucket_items)
 
-                if bucket_items > 0:
-                    logger.debug(f"Bucket {bucket_name}: {bucket_items} items")
-                    bucket_count += 1
+            if skipped_by_name:
+                logger.info(f"Skipped {skipped_by_name} TimelineItems by file name")
 
             logger.info(f"Filtered {item_count} TimelineItems from {bucket_count} buckets")
         else:
             month_files = self._iter_locokit2_item_files_for_range(start_dt, end_dt)
             month_file_count = 0
 
-            for item_file in month_files:
-                items = self._read_locokit2_item_file(item_file)
-                if not items:
+            for item_file, fully_inside in month_files:
+                # Stream items through the filter straight into the output file; months lying
+                # fully inside the range keep every item without checking its dates
+                items = self._iter_locokit2_items(item_file)
+                output_file = self.output_timeline_dir / item_file.name
+                # Collect place IDs per month so a corrupt month contributes nothing, whichever
+                # parser found the error and however far it got
+                month_place_ids: Set[str] = set()
+                selected = self._select_locokit2_items(items, None if fully_inside else overlaps, month_place_ids)
+                try:
+                    kept = _write_json_array(output_file, selected)
+                except JSON_DECODE_ERRORS + (IOError,) as e:
+                    logger.warning(f"Error reading item file {item_file.name}: {e}")
                     continue
+                place_ids |= month_place_ids
 
-                filtered_items = []
-                for item in items:
-                    base = item.get('base') or {}
-                    item_start = self._parse_date(base.get('startDate') or item.get('startDate'))
-                    item_end = self._parse_date(base.get('endDate') or item.get('endDate'))
-
-                    if item_start and item_end and item_start <= end_dt and item_end >= start_dt:
-                        filtered_items.append(item)
-                        place_id = self._extract_place_id(item)
-                        if place_id:
-                            place_ids.add(place_id)
-
-                if filtered_items:
-                    output_file = self.output_timeline_dir / item_file.name
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(filtered_items, f)
-
-                    item_count += len(filtered_items)
+                if kept:
+                    item_count += kept
                     month_file_count += 1
 
             logger.info(f"Filtered {item_count} TimelineItems from {month_file_count} month files")
@@ -227,67 +648,159 @@ class BackupFilter:
 
         return place_ids, item_count
     
-    def filter_locomotion_samples(self, start_date: str, end_date: str) -> int:
+    def _iter_timeline_item_entries(self, bucket_dirs: List[Path]) -> Iterator[Tuple[os.DirEntry, str]]:
+        """Walk the LocoKit1 bucket directories, yielding (entry, bucket name) per TimelineItem file."""
+        for bucket_dir in bucket_dirs:
+            # scandir yields names straight from the directory read, without glob matching
+            with os.scandir(bucket_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        yield entry, bucket_dir.name
+
+    def _uses_ulid_filenames(self, bucket_dirs: List[Path], sample_size: int = 16) -> bool:
+        """Check whether the first few TimelineItem files are named by ULID."""
+        sample = islice(self._iter_timeline_item_entries(bucket_dirs), sample_size)
+        names = [entry.name[:-5] for entry, _ in sample]
+        return bool(names) and all(ULID_PATTERN.fullmatch(name) for name in names)
+
+    def _filter_timeline_item_file(
+        self, entry: os.DirEntry, bucket_name: str, overlaps: Callable[[Optional[str], Optional[str]], bool]
+    ) -> Tuple[Union[bool, bytes], Optional[str]]:
+        """
+        Copy a single LocoKit1 TimelineItem file if it overlaps the date range.
+        
+        When consolidating, nothing is written here; the item's raw bytes are
+        returned instead so the caller can add them to the archive.
+        
+        Returns:
+            Tuple of (whether the item was copied, or its bytes when consolidating,
+            place ID referenced by the item)
+        """
+        try:
+            # Keep the raw bytes so a match can be written without re-reading the source
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+            if not data:
+                return False, None
+
+            # Cheap byte-level check first; most files lie outside the range and never need decoding
+            peek_start = _peek_date_key(data, b'"startDate"')
+            peek_end = _peek_date_key(data, b'"endDate"')
+            if peek_start and peek_end and not overlaps(peek_start, peek_end):
+                return False, None
+
+            item = _json_loads(data)
+
+            item_start = _date_key(item.get('startDate'))
+            item_end = _date_key(item.get('endDate'))
+
+            if overlaps(item_start, item_end):
+                if self.consolidate:
+                    result = data
+                else:
+                    output_file = self.output_timeline_dir / bucket_name / entry.name
+                    output_file.write_bytes(data)
+                    result = True
+
+                if item.get('isVisit') and 'placeId' in item:
+                    return result, item['placeId']
+                return result, None
+
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping corrupted JSON: {entry.name}")
+        except Exception as e:
+            logger.warning(f"Error processing {entry.name}: {e}")
+
+        return False, None
+    
+    def filter_locomotion_samples(
+        self, start_dt: datetime, end_dt: datetime, executor: Optional[ProcessPoolExecutor] = None
+    ) -> int:
         """
         Filter and copy LocomotionSamples within date range.
         
+        Args:
+            start_dt: Start of the range (naive, inclusive)
+            end_dt: End of the range (naive, inclusive)
+            executor: Process pool to filter week files in; a private one is used if omitted
+        
         Returns:
             Count of samples copied
         """
-        start_dt = self._parse_date(start_date)
-        end_dt = self._parse_date(end_date)
+        if executor is None:
+            # The default size is one worker per CPU, capped at 61 on Windows
+            with ProcessPoolExecutor() as executor:
+                return self.filter_locomotion_samples(start_dt, end_dt, executor)
         
-        logger.info(f"Filtering LocomotionSamples from {start_date} to {end_date}")
+        return self._collect_week_files(self._submit_week_files(start_dt, end_dt, executor))
+    
+    def _submit_week_files(
+        self, start_dt: datetime, end_dt: datetime, executor: ProcessPoolExecutor
+    ) -> List[Future]:
+        """Submit every week file overlapping the range to the process pool."""
+        logger.info(f"Filtering LocomotionSamples from {start_dt} to {end_dt}")
         
-        sample_count = 0
-        week_count = 0
+        # Compare samples as ISO strings rather than building a datetime for each one
+        start_key = start_dt.isoformat(timespec='seconds')
+        end_key = end_dt.isoformat(timespec='seconds')
         
         # Get all week files that overlap the date range
         week_files = self._get_week_files_for_range(start_dt, end_dt)
         
         logger.info(f"Processing {len(week_files)} week files")
         
-        for week_file in week_files:
-            try:
-                # Skip empty/corrupted files
-                if week_file.stat().st_size == 0:
-                    continue
-                
-                # Read week file
-                with gzip.open(week_file, 'rt', encoding='utf-8') as f:
-                    samples = json.load(f)
-                
-                # Filter samples by date
-                filtered_samples = []
-                for sample in samples:
-                    sample_date = self._parse_date(sample.get('date'))
-                    if sample_date and start_dt <= sample_date <= end_dt:
-                        filtered_samples.append(sample)
-                
-                if filtered_samples:
-                    # Write filtered samples to output
-                    output_file = self.output_sample_dir / week_file.name
-                    with gzip.open(output_file, 'wt', encoding='utf-8') as f:
-                        json.dump(filtered_samples, f)
-                    
-                    sample_count += len(filtered_samples)
-                    week_count += 1
-                    logger.debug(f"Week {week_file.name}: {len(filtered_samples)} samples")
-            
-            except (gzip.BadGzipFile, EOFError):
-                logger.warning(f"Corrupted gzip file: {week_file.name}")
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON in week file: {week_file.name}")
-            except Exception as e:
-                logger.warning(f"Error processing {week_file.name}: {e}")
+        # Week files are independent and CPU-bound; JSON decoding holds the GIL, so
+        # use processes (arguments are just paths and key strings, cheap to pickle)
+        return [
+            executor.submit(
+                _process_week_file, week_file, fully_inside, start_key, end_key,
+                self.output_sample_dir, self.output_compresslevel
+            )
+            for week_file, fully_inside in week_files
+        ]
+    
+    def _collect_week_files(self, futures: List[Future]) -> int:
+        """Wait for submitted week files and total their sample counts."""
+        sample_count = 0
+        week_count = 0
+        for future in as_completed(futures):
+            count = future.result()
+            if count:
+                sample_count += count
+                week_count += 1
         
         logger.info(f"Filtered {sample_count} LocomotionSamples from {week_count} week files")
         return sample_count
     
-    def _get_week_files_for_range(self, start_dt: datetime, end_dt: datetime) -> List[Path]:
-        """Get list of week files that cover the date range."""
+    def _get_week_files_for_range(self, start_dt: datetime, end_dt: datetime) -> List[Tuple[Path, bool]]:
+        """Get (week file, fully inside range) pairs for the week files that cover the date range."""
+        # Build the expected YYYY-Wnn names from ISO week math instead of parsing every file name
+        available = _list_file_names(self.locomotion_sample_dir, '.json.gz')
         week_files = []
-        all_files = sorted(self.locomotion_sample_dir.glob("*.json.gz"))
+        # Widen the walk by the boundary margin: a neighbouring week's file can hold samples
+        # that spill into the range; the per-sample filter trims them
+        first_day = start_dt - PERIOD_BOUNDARY_MARGIN
+        last_day = end_dt + PERIOD_BOUNDARY_MARGIN
+        monday = datetime(first_day.year, first_day.month, first_day.day) - timedelta(days=first_day.weekday())
+        while monday <= last_day:
+            year, week, _ = monday.isocalendar()
+            name = f"{year}-W{week:02d}.json.gz"
+            if name in available:
+                week_file = self.locomotion_sample_dir / name
+                fully_inside = _period_fully_inside(monday, monday + timedelta(weeks=1), start_dt, end_dt)
+                week_files.append((week_file, fully_inside))
+            monday += timedelta(weeks=1)
+        
+        if not week_files:
+            # Fall back to a full scan in case the files are not named canonically
+            return self._scan_week_files_for_range(start_dt, end_dt)
+        return week_files
+    
+    def _scan_week_files_for_range(self, start_dt: datetime, end_dt: datetime) -> List[Tuple[Path, bool]]:
+        """Scan the sample directory for week files that overlap the date range."""
+        week_files = []
+        with os.scandir(self.locomotion_sample_dir) as entries:
+            all_files = [Path(e.path) for e in entries if e.name.endswith('.json.gz')]
         
         for week_file in all_files:
             # Parse week file name: YYYY-Wnn.json.gz
@@ -305,49 +818,93 @@ class BackupFilter:
                 week_start = week1_monday + timedelta(weeks=week - 1)
                 week_end = week_start + timedelta(days=7)
                 
-                # Include if week overlaps date range
-                if week_start <= end_dt and week_end >= start_dt:
-                    week_files.append(week_file)
+                # Include if week overlaps date range, allowing for boundary spill
+                if week_start <= end_dt + PERIOD_BOUNDARY_MARGIN and week_end >= start_dt - PERIOD_BOUNDARY_MARGIN:
+                    fully_inside = _period_fully_inside(week_start, week_end, start_dt, end_dt)
+                    week_files.append((week_file, fully_inside))
             
             except (ValueError, IndexError):
                 logger.warning(f"Could not parse week file name: {week_file.name}")
         
         return week_files
 
-    def _iter_locokit2_item_files_for_range(self, start_dt: datetime, end_dt: datetime) -> List[Path]:
+    def _iter_locokit2_item_files_for_range(self, start_dt: datetime, end_dt: datetime) -> List[Tuple[Path, bool]]:
+        """Get (month file, fully inside range) pairs for the month files that cover the date range."""
+        available = _list_file_names(self.timeline_item_dir, '.json')
         files = []
         current = datetime(start_dt.year, start_dt.month, 1)
         end_marker = datetime(end_dt.year, end_dt.month, 1)
         while current <= end_marker:
+            next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
             name = f"{current.year:04d}-{current.month:02d}.json"
-            path = self.timeline_item_dir / name
-            if path.exists():
-                files.append(path)
-            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if name in available:
+                fully_inside = _period_fully_inside(current, next_month, start_dt, end_dt)
+                files.append((self.timeline_item_dir / name, fully_inside))
+            current = next_month
         return files
 
-    def _read_locokit2_item_file(self, item_file: Path) -> List[Dict]:
-        try:
-            if item_file.stat().st_size == 0:
-                return []
-            with open(item_file, 'r', encoding='utf-8') as f:
-                items = json.load(f)
-            return items if isinstance(items, list) else []
-        except (json.JSONDecodeError, IOError) as e:
-            logger.warning(f"Error reading item file {item_file.name}: {e}")
-            return []
-
-    def _extract_place_id(self, item: Dict) -> Optional[str]:
-        base = item.get('base') or {}
-        visit = item.get('visit') or {}
-        place = item.get('place') or {}
-
-        for candidate in (
-            item.get('placeId'),
-            base.get('placeId'),
-            visit.get('placeId') if isinstance(visit, dict) else None,
-            place.get('id') if isinstance(place, dict) else None,
-        ):
+    def _iter_locokit2_items(self, item_file: Path) -> Iterator[Dict]:
+        """
+        Yield the items of a LocoKit2 month file, streaming with ijson when it is installed.
+        
+        Decode and read errors propagate to the caller, which may already have
+        consumed part of the file when streaming.
+        """
+        with open(item_file, 'rb') as f:
+            if not f.peek(1):
+                return
+            if ijson is not None:
+                yield from ijson.items(f, 'item', use_float=True)
+                return
+            # Let the parser read straight from the page cache instead of copying the file first
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    items = _json_loads(view)
+        if isinstance(items, list):
+            yield from items
+
+    def _select_locokit2_items(
+        self,
+        items: Iterable[Dict],
+        overlaps: Optional[Callable[[Optional[str], Optional[str]], bool]],
+        place_ids: Set[str],
+    ) -> Iterator[Dict]:
+        """Yield the LocoKit2 items overlapping the range (all if overlaps is None), recording place IDs."""
+        for item in items:
+            base = item.get('base') or {}
+            if overlaps is not None:
+                item_start = _date_key(base.get('startDate') or item.get('startDate'))
+                item_end = _date_key(base.get('endDate') or item.get('endDate'))
+                if not overlaps(item_start, item_end):
+                    continue
+
+            place_id = self._extract_place_id(item, base)
+            if place_id:
+                place_ids.add(place_id)
+            yield item
+
+    def _extract_place_id(self, item: Dict, base: Optional[Dict] = None) -> Optional[str]:
+        """Return the item's place ID, reusing its already-resolved base dict when given."""
+        # Check the sources in priority order, only looking up the next one when needed
+        candidate = item.get('placeId')
+        if isinstance(candidate, str) and candidate:
+            return candidate
+
+        if base is None:
+            base = item.get('base') or {}
+        candidate = base.get('placeId')
+        if isinstance(candidate, str) and candidate:
+            return candidate
+
+        visit = item.get('visit')
+        if isinstance(visit, dict):
+            candidate = visit.get('placeId')
+            if isinstance(candidate, str) and candidate:
+                return candidate
+
+        place = item.get('place')
+        if isinstance(place, dict):
+            candidate = place.get('id')
             if isinstance(candidate, str) and candidate:
                 return candidate
         return None
@@ -368,59 +925,89 @@ class BackupFilter:
         place_count = 0
 
         if self.backup_type == "locokit1":
+            # Group by bucket so each output directory is created once
+            buckets: Dict[str, List[str]] = defaultdict(list)
             for place_id in place_ids:
-                try:
-                    bucket = place_id[0].upper()
-                    source_file = self.place_dir / bucket / f"{place_id}.json"
+                if isinstance(place_id, str) and place_id:
+                    buckets[place_id[0].upper()].append(place_id)
 
-                    if not source_file.exists():
-                        logger.debug(f"Place file not found: {place_id}")
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                results = []
+                for bucket, bucket_ids in sorted(buckets.items()):
+                    source_bucket = self.place_dir / bucket
+                    if not source_bucket.is_dir():
+                        logger.debug(f"Place bucket not found: {bucket}")
                         continue
 
                     output_bucket = self.output_place_dir / bucket
                     output_bucket.mkdir(exist_ok=True)
+                    results.append(executor.map(
+                        self._copy_place_file, bucket_ids, repeat(source_bucket), repeat(output_bucket)
+                    ))
 
-                    output_file = output_bucket / f"{place_id}.json"
-                    shutil.copy2(source_file, output_file)
-                    place_count += 1
-
-                except Exception as e:
-                    logger.warning(f"Error copying place {place_id}: {e}")
+                place_count = sum(sum(copied) for copied in results)
         else:
-            bucket_ids = sorted({pid[0].upper() for pid in place_ids if isinstance(pid, str) and pid})
-            place_id_set = {pid for pid in place_ids if isinstance(pid, str) and pid}
+            # Group by bucket in one pass so each bucket file is checked only against its own IDs
+            wanted_by_bucket: Dict[str, Set[str]] = defaultdict(set)
+            for place_id in place_ids:
+                if isinstance(place_id, str) and place_id:
+                    wanted_by_bucket[place_id[0].upper()].add(place_id)
 
-            for bucket in bucket_ids:
+            for bucket, wanted in sorted(wanted_by_bucket.items()):
                 source_file = self.place_dir / f"{bucket}.json"
                 if not source_file.exists():
                     logger.debug(f"Place bucket file not found: {bucket}.json")
                     continue
 
                 try:
-                    with open(source_file, 'r', encoding='utf-8') as f:
-                        places = json.load(f)
+                    places = _json_loads(source_file.read_bytes())
                     if not isinstance(places, list):
                         continue
 
-                    filtered_places = [p for p in places if p.get('id') in place_id_set]
-                    if not filtered_places:
-                        continue
-
                     output_file = self.output_place_dir / f"{bucket}.json"
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(filtered_places, f)
-
-                    place_count += len(filtered_places)
+                    place_count += _write_json_array(output_file, self._select_places(places, wanted))
                 except (json.JSONDecodeError, IOError) as e:
                     logger.warning(f"Error reading place bucket {bucket}: {e}")
 
         logger.info(f"Copied {place_count} place records")
         return place_count
     
-    def run(self, start_date: str, end_date: str) -> Dict[str, int]:
+    def _select_places(self, places: List[Dict], wanted: Set[str]) -> Iterator[Dict]:
+        """Yield the places in a LocoKit2 bucket whose ID is wanted, stopping once all are found."""
+        remaining = set(wanted)
+        for place in places:
+            place_id = place.get('id')
+            if place_id in wanted:
+                yield place
+                remaining.discard(place_id)
+                if not remaining:
+                    break
+
+    def _copy_place_file(self, place_id: str, source_bucket: Path, output_bucket: Path) -> bool:
+        """Copy a single LocoKit1 Place file; returns True if it was copied."""
+        try:
+            source_file = source_bucket / f"{place_id}.json"
+
+            # Attempt the copy directly rather than probing with a separate exists() call
+            output_file = output_bucket / f"{place_id}.json"
+            _fast_copy(source_file, output_file)
+            return True
+
+        except FileNotFoundError:
+            logger.debug(f"Place file not found: {place_id}")
+            return False
+        except Exception as e:
+            logger.warning(f"Error copying place {place_id}: {e}")
+            return False
+    
+    def run(self, start_dt: datetime, end_dt: datetime) -> Dict[str, int]:
         """
         Run the full filter operation.
         
+        Args:
+            start_dt: Start of the range (naive, inclusive)
+            end_dt: End of the range (naive, inclusive)
+        
         Returns:
             Dictionary with counts of items, samples, and places
         """
@@ -432,14 +1019,25 @@ class BackupFilter:
         logger.info("=" * 70)
         
         try:
-            # Step 1: Filter TimelineItems
-            place_ids, timeline_count = self.filter_timeline_items(start_date, end_date)
-            
-            # Step 2: Filter LocomotionSamples
-            sample_count = self.filter_locomotion_samples(start_date, end_date)
+            if start_dt > end_dt:
+                raise ValueError("Start date cannot be after end date")
             
-            # Step 3: Copy Places
-            place_count = self.copy_places(place_ids)
+            # One process pool for the whole run. Samples don't depend on the other steps, so
+            # their week files are submitted first and filtered while TimelineItems and Places
+            # are handled here; submitting first also forks the workers before any thread pool
+            # is running in this process. The default size is one worker per CPU, capped at 61
+            # on Windows
+            with ProcessPoolExecutor() as process_pool:
+                # Step 1: Start filtering LocomotionSamples
+                week_futures = self._submit_week_files(start_dt, end_dt, process_pool)
+                
+                # Step 2: Filter TimelineItems
+                place_ids, timeline_count = self.filter_timeline_items(start_dt, end_dt)
+                
+                # Step 3: Copy Places
+                place_count = self.copy_places(place_ids)
+                
+                sample_count = self._collect_week_files(week_futures)
             
             logger.info("=" * 70)
             logger.info("✓ Filter operation completed successfully!")
@@ -527,6 +1125,28 @@ Examples:
         help='End date/time (format: YYYY-MM-DD HH:MM:SS). Required with --start.'
     )
     
+    parser.add_argument(
+        '--filename-shortcut',
+        action='store_true',
+        help='Skip LocoKit1 TimelineItems whose ULID file names show they were created more than '
+             '31 days before the range, without opening them'
+    )
+    
+    parser.add_argument(
+        '--output-compresslevel',
+        type=int,
+        choices=range(10),
+        default=DEFAULT_COMPRESSLEVEL,
+        metavar='{0-9}',
+        help=f'gzip level for filtered sample files (default: {DEFAULT_COMPRESSLEVEL})'
+    )
+    
+    parser.add_argument(
+        '--consolidate',
+        action='store_true',
+        help='Write LocoKit1 TimelineItems into a single TimelineItem.tar instead of one file each'
+    )
+    
     return parser.parse_args()
 
 
@@ -539,28 +1159,37 @@ def main():
         if not args.end:
             parser = argparse.ArgumentParser()
             parser.error("--end is required when using --start")
-        start_date = args.start
-        end_date = args.end
+        start_dt = _parse_date(args.start)
+        end_dt = _parse_date(args.end)
     
     elif args.date:
-        start_date = f"{args.date} 00:00:00"
-        end_date = f"{args.date} 23:59:59"
+        start_dt = _parse_date(f"{args.date} 00:00:00")
+        end_dt = _parse_date(f"{args.date} 23:59:59")
     
     elif args.days:
-        end_dt = datetime.now()
-        start_dt = end_dt - timedelta(days=args.days)
-        start_date = start_dt.strftime("%Y-%m-%d 00:00:00")
-        end_date = end_dt.strftime("%Y-%m-%d 23:59:59")
+        now = datetime.now().replace(microsecond=0)
+        start_dt = (now - timedelta(days=args.days)).replace(hour=0, minute=0, second=0)
+        end_dt = now.replace(hour=23, minute=59, second=59)
     
     else:
         parser = argparse.ArgumentParser()
         parser.error("Must specify --start/--end, --date, or --days")
     
-    logger.info(f"Date range: {start_date} to {end_date}")
+    # Parse once here; everything downstream works on datetime objects
+    if not start_dt or not end_dt:
+        raise ValueError("Invalid date format. Use: YYYY-MM-DD HH:MM:SS")
+    
+    logger.info(f"Date range: {start_dt} to {end_dt}")
     
     # Run filter
-    filter_obj = BackupFilter(args.backup_dir, args.output_dir)
-    results = filter_obj.run(start_date, end_date)
+    filter_obj = BackupFilter(
+        args.backup_dir,
+        args.output_dir,
+        filename_shortcut=args.filename_shortcut,
+        output_compresslevel=args.output_compresslevel,
+        consolidate=args.consolidate,
+    )
+    results = filter_obj.run(start_dt, end_dt)
     
     return 0
 